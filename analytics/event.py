@@ -1,5 +1,5 @@
 """Module to define the Event class."""
-import re
+import sys
 
 from analytics.exception import LogparserException
 
@@ -19,14 +19,18 @@ class Event:  # pylint: disable=too-many-instance-attributes
         multiples (set of str): Codes that can correctly be repeated in a log
     """
 
+    __slots__ = ('rows', 'line', 'code', 'start_time', 'max_time',
+                 'min_time', 'increasing', 'stage', '_last_time',
+                 '_prompts', '_prompt_set')
+
     RELATION = 'RELATION'
     BOOKEND = 'BOOKEND'
     QUESTION = 'QUESTION'
 
-    relations = {'rC', 'rV', 'rS'}
-    bookends = {'BF', 'FF'}
-    bookend_xpaths = {'uC', 'BF', 'FF', 'null'}
-    multiples = {'LF', 'FF', 'rV', 'rS', 'SF', 'CC'}
+    relations = frozenset({'rC', 'rV', 'rS'})
+    bookends = frozenset({'BF', 'FF'})
+    bookend_xpaths = frozenset({'uC', 'BF', 'FF', 'null'})
+    multiples = frozenset({'LF', 'FF', 'rV', 'rS', 'SF', 'CC'})
 
     def __init__(self, row, line):
         """Initialize the event with a single row.
@@ -43,6 +47,9 @@ class Event:  # pylint: disable=too-many-instance-attributes
         self.max_time = row[0]
         self.min_time = row[0]
         self.increasing = True
+        self._last_time = row[0]
+        self._prompts = None
+        self._prompt_set = None
         xpath = row[2]
         self.stage = self.get_stage(self.code, xpath)
 
@@ -83,8 +90,9 @@ class Event:  # pylint: disable=too-many-instance-attributes
         self.max_time = max(self.max_time, this_time)
         self.min_time = min(self.min_time, this_time)
 
-        if self.increasing and this_time < self.last_time():
+        if self.increasing and this_time < self._last_time:
             self.increasing = False
+        self._last_time = this_time
 
         self.rows.append(row)
 
@@ -113,34 +121,73 @@ class Event:  # pylint: disable=too-many-instance-attributes
         self.max_time = time
         self.min_time = time
         self.increasing = True
+        self._last_time = time
 
     def last_time(self):
         """Get the time of the last line in this event."""
-        last_row = self.rows[-1]
-        last_time = last_row[0]
-        return last_time
+        return self._last_time
 
     def create_pause_next(self):
-        """Create a onPause event immediately after this event."""
-        next_event = self.copy()
-        next_event.set_code('oP')
-        next_event.set_time(self.max_time + 1)
+        """Create a onPause event immediately after this event.
+
+        The new event shares this event's rows instead of copying them.
+        The inserted pause only exists to close an oR -> oP pair, and
+        nothing downstream mutates event rows, so sharing is safe and
+        turns an O(n) copy plus re-add into an O(1) construction.
+        """
+        next_event = object.__new__(Event)
+        next_event.rows = self.rows
+        next_event.code = 'oP'
+        next_time = self.max_time + 1
+        next_event.start_time = next_time
+        next_event.min_time = next_time
+        next_event.max_time = next_time
+        next_event.increasing = True
+        next_event._last_time = next_time
+        next_event._prompts = self._prompts
+        next_event._prompt_set = self._prompt_set
+        next_event.stage = self.stage
         next_event.line = self.line + len(self.rows) + 0.5
         return next_event
 
+    @property
+    def prompt_set(self):
+        """Get the set of prompts in this event.
+
+        The frozenset is computed on first access and cached, since the
+        same event is intersected with others more than once.
+        """
+        if self._prompt_set is None:
+            self._prompt_set = frozenset(self.prompts())
+        return self._prompt_set
+
     def prompts(self):
         """Get the prompts contained in this event.
 
-        Yields:
-            The next prompt, extracted from the xpath, for this event.
+        The prompt is the last path component of the xpath, minus its
+        "[1]" suffix, e.g. "/data/EA[1]" gives "EA". Plain string ops are
+        used here instead of a regex because this runs for every log row.
+        Prompts are interned since the same handful of names recur across
+        every event in a log, which makes later set operations compare by
+        identity. The extraction runs once per event; repeat callers get
+        the cached tuple.
+
+        Returns:
+            A tuple of the prompts, extracted from the xpaths, for this
+            event.
         """
-        for row in self.rows:
-            xpath = row[2]
-            found = re.search(r'(^|/)([^/]+)\[1\]$', xpath)
-            if found:
-                yield found.group(2)
-            else:
-                yield xpath
+        if self._prompts is None:
+            prompts = []
+            for row in self.rows:
+                xpath = row[2]
+                if xpath.endswith('[1]'):
+                    prompt = xpath[:-3].rpartition('/')[2]
+                    if prompt:
+                        prompts.append(sys.intern(prompt))
+                        continue
+                prompts.append(sys.intern(xpath))
+            self._prompts = tuple(prompts)
+        return self._prompts
 
     def is_repeatable(self):
         """Return true iff the current event code is repeatable in a log."""
@@ -1,26 +1,18 @@
 """Define a CLI to get analytics metadata."""
 import argparse
-import glob
-import json
-import os.path
+
+from analytics.formdata import lookup
 
 
 def get_formdata():
     """Search package data to get all relevant analytics information."""
     all_data = []
-    search = os.path.join(os.path.split(__file__)[0], '*.json')
-    for path in glob.glob(search):
-        try:
-            with open(path, encoding='utf-8') as json_data:
-                obj = json.load(json_data)
-                for singleton in obj:
-                    data = {}
-                    data['form_title'] = singleton.get('form_title', '')
-                    data['form_id'] = singleton.get('form_id', '')
-                    data['created'] = singleton.get('created', '')
-                    all_data.append(data)
-        except json.JSONDecodeError:
-            pass
+    for singleton in lookup.all_form_objects():
+        data = {}
+        data['form_title'] = singleton.get('form_title', '')
+        data['form_id'] = singleton.get('form_id', '')
+        data['created'] = singleton.get('created', '')
+        all_data.append(data)
     return all_data
 
 
@@ -44,9 +36,11 @@ def formdata_cli():
     show_all = not any((args.form_title, args.form_id, args.date))
 
     all_data = get_formdata()
-    title_width = max(len(str(i['form_title'])) for i in all_data)
-    id_width = max(len(str(i['form_id'])) for i in all_data)
-    date_width = max(len(str(i['created'])) for i in all_data)
+    title_width = id_width = date_width = 0
+    for form in all_data:
+        title_width = max(title_width, len(str(form['form_title'])))
+        id_width = max(id_width, len(str(form['form_id'])))
+        date_width = max(date_width, len(str(form['created'])))
     for form in all_data:
         show = []
         if show_all or args.form_title:
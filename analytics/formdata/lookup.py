@@ -1,4 +1,5 @@
 """Functions for retrieving analytics metadata."""
+import functools
 import glob
 import json
 import logging
@@ -7,10 +8,60 @@ import os.path
 from analytics.exception import LookupException
 
 
+try:
+    import orjson
+    # pylint cannot introspect the compiled extension
+    _LOADS = orjson.loads  # pylint: disable=no-member
+except ImportError:
+    # orjson is an optional speedup; the stdlib parser always works
+    _LOADS = json.loads
+
+
+_PKG_DIR = os.path.dirname(__file__)
+_SEARCH = os.path.join(_PKG_DIR, '*.json')
+
+
+@functools.lru_cache(maxsize=1)
+def all_form_objects():
+    """Parse all analytics objects from package data.
+
+    The package JSON files are globbed and parsed once per process; both
+    lookup() and the formdata CLI consume this shared cache.
+
+    Returns:
+        A tuple of all analytics objects, in file then object order.
+    """
+    objects = []
+    for path in glob.glob(_SEARCH):
+        try:
+            with open(path, encoding='utf-8') as json_data:
+                objects.extend(_LOADS(json_data.read()))
+        except ValueError:
+            logging.warning('File "%s" not valid JSON', path)
+    return tuple(objects)
+
+
+@functools.lru_cache(maxsize=1)
+def form_id_index():
+    """Build a lookup index from all analytics objects in package data.
+
+    The first object found for a form id wins, matching the old
+    file-by-file scan order.
+
+    Returns:
+        A dictionary mapping form id to its analytics object.
+    """
+    index = {}
+    for obj in all_form_objects():
+        index.setdefault(obj['form_id'], obj)
+    return index
+
+
 def lookup(form_id, src=None):
     """Return the analytics object for this form_id.
 
-    Uses src if supplied, otherwise searches in package files.
+    Uses src if supplied, otherwise searches in package files. Package
+    files are parsed and indexed only on the first call.
 
     Args:
         form_id (str): The form id to get information for
@@ -30,11 +81,7 @@ def lookup(form_id, src=None):
             msg = f'Analytics lookup source not found: "{src}"'
             raise LookupException(msg)
     else:
-        search = os.path.join(os.path.split(__file__)[0], '*.json')
-        for path in glob.glob(search):
-            to_return = obj_by_id(path, form_id)
-            if to_return:
-                break
+        to_return = form_id_index().get(form_id)
     if to_return:
         return to_return
     else:
@@ -56,9 +103,9 @@ def obj_by_id(path, form_id):
     to_return = None
     try:
         with open(path, encoding='utf-8') as json_data:
-            obj = json.load(json_data)
+            obj = _LOADS(json_data.read())
             to_return = next((o for o in obj if o['form_id'] == form_id))
-    except json.JSONDecodeError:
+    except ValueError:
         logging.warning('File "%s" not valid JSON', path)
     except StopIteration:
         # Did not find supplied 'form_id'
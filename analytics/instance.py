@@ -1,4 +1,7 @@
 """Module to contain the Instance class, representing one ODK instance."""
+import collections
+import concurrent.futures
+import functools
 import glob
 import logging
 import os.path
@@ -8,6 +11,31 @@ from analytics.logparser import Logparser
 from analytics.event import Event
 
 
+LOGGER = logging.getLogger(__name__)
+
+# Marks an xpath not seen before in track_prompt_value
+_SENTINEL = object()
+
+
+@functools.lru_cache(maxsize=8)
+def tag_pattern(tags):
+    """Compile one pattern that matches any of the given XML tags.
+
+    The pattern is an alternation over all tags, so one scan of the
+    document finds every tag of interest. Compilation is cached since the
+    tags are fixed across all instances in a run.
+
+    Args:
+        tags (tuple of str): The XML tag names to match
+
+    Returns:
+        A compiled pattern with the tag as group 1 and its value as
+        group 2.
+    """
+    alternation = '|'.join(re.escape(tag) for tag in tags)
+    return re.compile(f'<({alternation})>([^<>]+)</\\1>')
+
+
 class Instance:  # pylint: disable=too-many-instance-attributes
     # pylint: disable=too-many-public-methods
     """The Instance class represents one instance to be analyzed.
@@ -50,6 +78,15 @@ class Instance:  # pylint: disable=too-many-instance-attributes
         * Support for config (to override default cutoffs)
     """
 
+    __slots__ = ('full_name', 'folder', 'xml', 'txt', 'jpg', 'xml_size',
+                 'txt_size', 'jpg_size', 'tags', 'tag_data', 'log_version',
+                 'resumed', 'paused', 'short_break', 'save_count',
+                 'enter_count', 'relation_self_destruct', 'prompts',
+                 'prompt_resumed', 'prompt_short_break', 'prompt_cc',
+                 'prompt_visits', 'prompt_changes', 'prompt_value',
+                 'uncaptured_prompts', 'short_break_threshold',
+                 'event_threshold', 'relation_threshold')
+
     COUNT = 0
     LOG = 'log.txt'
     XML = 'submission.xml'
@@ -71,13 +108,13 @@ class Instance:  # pylint: disable=too-many-instance-attributes
             tags (seq of str): XML tag names to extract from submission.xml
         """
         self.full_name = name
-        self.folder = os.path.split(self.full_name)[1]
+        self.folder = os.path.basename(self.full_name)
 
         # Initialize thresholds
         self.initialize_constants()
 
         Instance.COUNT += 1
-        logging.debug("[%s] Beginning work (%d)", self.folder, self.COUNT)
+        LOGGER.debug("[%s] Beginning work (%d)", self.folder, self.COUNT)
 
         # General file size information
         self.summarize_file_sizes()
@@ -97,17 +134,39 @@ class Instance:  # pylint: disable=too-many-instance-attributes
         self.enter_count = 0
         self.relation_self_destruct = 0
         # Individual prompt information
-        self.prompts = prompts if prompts else []
-        self.prompt_resumed = {}
-        self.prompt_short_break = {}
-        self.prompt_cc = {}
-        self.prompt_visits = {}
-        self.prompt_changes = {}
+        self.prompts = frozenset(prompts) if prompts else frozenset()
+        self.prompt_resumed = collections.defaultdict(int)
+        self.prompt_short_break = collections.defaultdict(int)
+        self.prompt_cc = collections.defaultdict(int)
+        self.prompt_visits = collections.defaultdict(int)
+        self.prompt_changes = collections.defaultdict(int)
         self.prompt_value = {}
         self.uncaptured_prompts = set()
 
         self.summarize_log()
 
+    @classmethod
+    def bulk(cls, names, prompts=None, tags=None, workers=None):
+        """Analyze many instance folders across a pool of processes.
+
+        Log parsing is CPU-bound, so a batch of instances scales across
+        cores with processes where threads cannot. Results come back in
+        the same order as the supplied names.
+
+        Args:
+            names (seq of str): Paths to the instance folders to analyze
+            prompts (seq of str): Prompt names to analyze from log.txt
+            tags (seq of str): XML tag names to extract from submission.xml
+            workers (int): Worker process count, defaulting to the CPU
+                count
+
+        Returns:
+            A list of analyzed Instance objects, one per name, in order.
+        """
+        analyze = functools.partial(cls, prompts=prompts, tags=tags)
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            return list(executor.map(analyze, names, chunksize=16))
+
     def initialize_constants(self):
         """Initialize constants and thresholds for analysis."""
         self.short_break_threshold = self.THIRTY_MIN
@@ -115,14 +174,35 @@ class Instance:  # pylint: disable=too-many-instance-attributes
         self.relation_threshold = self.TEN_SEC
 
     def summarize_file_sizes(self):
-        """Get the sizes of various files in bytes."""
-        self.xml = self.find_files(self.XML)
-        self.txt = self.find_files(self.LOG)
-        self.jpg = self.find_files('*.[jJ][pP][gG]', '*.[jJ][pP][eE][gG]')
+        """Get the sizes of various files in bytes.
 
-        self.xml_size = self.file_size(*self.xml)
-        self.txt_size = self.file_size(*self.txt)
-        self.jpg_size = self.file_size(*self.jpg)
+        A single scandir pass classifies the instance files by name and
+        sums their sizes from the stat information the scan already
+        fetched, instead of one glob walk per pattern plus one stat per
+        file.
+        """
+        self.xml = []
+        self.txt = []
+        self.jpg = []
+        self.xml_size = 0
+        self.txt_size = 0
+        self.jpg_size = 0
+        try:
+            with os.scandir(self.full_name) as entries:
+                for entry in entries:
+                    name = entry.name
+                    if name == self.XML:
+                        self.xml.append(entry.path)
+                        self.xml_size += entry.stat().st_size
+                    elif name == self.LOG:
+                        self.txt.append(entry.path)
+                        self.txt_size += entry.stat().st_size
+                    elif name.lower().endswith(('.jpg', '.jpeg')):
+                        self.jpg.append(entry.path)
+                        self.jpg_size += entry.stat().st_size
+        except (FileNotFoundError, NotADirectoryError):
+            # Match the old glob behavior: a bad path finds no files
+            pass
 
     def find_files(self, *pattern):
         """Look for the given patterns in the instance directory.
@@ -159,21 +239,19 @@ class Instance:  # pylint: disable=too-many-instance-attributes
         document gets its value saved in a dictionary of tag data.
         """
         if len(self.xml) != 1:
-            logging.error('[%s] Number of xml files found: %d', self.folder,
-                          len(self.xml))
+            LOGGER.error('[%s] Number of xml files found: %d', self.folder,
+                         len(self.xml))
             return
         if not self.tags:
             return
 
-        full_file = os.path.join(self.full_name, self.XML)
+        full_file = self.xml[0]
+        pattern = tag_pattern(tuple(self.tags))
         with open(full_file, encoding='utf-8') as open_file:
             contents = open_file.read()
-            for tag in self.tags:
-                pattern = f'<{tag}>([^<>]+)</{tag}>'
-                match = re.search(pattern, contents)
-                if match:
-                    value = match.group(1)
-                    self.tag_data[tag] = value
+        for match in pattern.finditer(contents):
+            # setdefault keeps the first match, as the per-tag search did
+            self.tag_data.setdefault(match.group(1), match.group(2))
 
     def summarize_log(self):
         """Get needed information from log.txt.
@@ -185,20 +263,33 @@ class Instance:  # pylint: disable=too-many-instance-attributes
         """
         if len(self.txt) != 1:
             msg = '[%s] Number of txt files found: %d'
-            logging.error(msg, self.folder, len(self.txt))
+            LOGGER.error(msg, self.folder, len(self.txt))
             return
 
-        full_file = os.path.join(self.full_name, self.LOG)
+        full_file = self.txt[0]
         parser = Logparser(full_file, event_threshold=self.event_threshold,
                            relation_threshold=self.relation_threshold)
         self.log_version = parser.version
         state = LogParseState()
+        # Bind the per-event trackers once so the hot loop uses local
+        # loads instead of an attribute lookup per call
+        check_event_order = self.check_event_order
+        track_resume_pause = self.track_resume_pause
+        track_question_time = self.track_question_resumed_time
+        track_countables = self.track_countables
+        track_prompt_value = self.track_prompt_value
+        # Per-prompt time and value tracking only matter when prompts
+        # are tracked; visit counting always runs so that uncaptured
+        # prompts are still discovered
+        track_prompts = bool(self.prompts)
         for event in parser:
-            self.check_event_order(event, state)
-            self.track_resume_pause(event, state)
-            self.track_question_resumed_time(event, state)
-            self.track_countables(event)
-            self.track_prompt_value(event)
+            check_event_order(event, state)
+            track_resume_pause(event, state)
+            track_countables(event)
+            if track_prompts:
+                track_question_time(event, state)
+                track_prompt_value(event)
+            state.prev_event = event
 
     def check_event_order(self, event, state):
         """Check if the event is out of order with the analysis state.
@@ -209,10 +300,10 @@ class Instance:  # pylint: disable=too-many-instance-attributes
             event (Event): The next event to analyze
             state (LogParseState): The state of the log-event analysis
         """
-        if state.prev_event and state.prev_event > event:
-            msg = '[{}] Out of order events: {} and {}'
-            msg = msg.format(self.folder, state.prev_event, event)
-            logging.warning(msg)
+        prev_event = state.prev_event
+        if prev_event is not None and prev_event.min_time > event.max_time:
+            LOGGER.warning('[%s] Out of order events: %s and %s',
+                           self.folder, prev_event, event)
 
     def track_resume_pause(self, event, state):
         """Track state in relation to onResume and onPause.
@@ -237,26 +328,24 @@ class Instance:  # pylint: disable=too-many-instance-attributes
                 state.last_resume = event
                 state.last_pause = None
             elif state.last_resume and state.last_pause is None:
-                msg = '[{}] Still oR, oR ({} and {}) without oP'
-                msg = msg.format(self.folder, state.last_resume, event)
-                logging.warning(msg)
+                LOGGER.warning('[%s] Still oR, oR (%s and %s) without oP',
+                               self.folder, state.last_resume, event)
         elif event.code == 'oP':
             if state.last_pause is None and state.last_resume is None:
-                msg = '[%s] Before first oR, found oP: %s'
-                logging.warning(msg, self.folder, str(event))
+                LOGGER.warning('[%s] Before first oR, found oP: %s',
+                               self.folder, event)
             elif state.last_resume and state.last_pause is None:
-                resumed_diff = event - state.last_resume
+                resume_ev = state.last_resume
+                resumed_diff = event - resume_ev
                 self.update_resumed(resumed_diff)
                 state.last_resume = None
                 state.last_pause = event
                 if resumed_diff > self.TWO_HR:
-                    msg = '[{}] Large resumed time (>2hr) between {} and {}'
-                    msg = msg.format(self.folder, state.last_resume, event)
-                    logging.warning(msg)
+                    msg = '[%s] Large resumed time (>2hr) between %s and %s'
+                    LOGGER.warning(msg, self.folder, resume_ev, event)
             elif state.last_pause and state.last_resume is None:
-                msg = '[{}] oP, oP ({} and {}) without oR'
-                msg = msg.format(self.folder, state.last_pause, event)
-                logging.warning(msg)
+                LOGGER.warning('[%s] oP, oP (%s and %s) without oR',
+                               self.folder, state.last_pause, event)
 
     def track_question_resumed_time(self, event, state):
         """Track resumed time for questionnaire prompts.
@@ -322,19 +411,14 @@ class Instance:  # pylint: disable=too-many-instance-attributes
         for entry, prompt in zip(event, event.prompts()):
             xpath = entry[2]
             value = entry[3]
-            if xpath not in self.prompt_value:
+            previous = self.prompt_value.get(xpath, _SENTINEL)
+            if previous is _SENTINEL:
                 self.prompt_value[xpath] = value
                 if value != '':
-                    try:
-                        self.prompt_changes[prompt] += 1
-                    except KeyError:
-                        self.prompt_changes[prompt] = 1
-            elif self.prompt_value[xpath] != value:
-                self.prompt_value[xpath] = value
-                try:
                     self.prompt_changes[prompt] += 1
-                except KeyError:
-                    self.prompt_changes[prompt] = 1
+            elif previous != value:
+                self.prompt_value[xpath] = value
+                self.prompt_changes[prompt] += 1
 
     def screen_cc(self, cc_event):
         """Track code CC from given event.
@@ -351,10 +435,7 @@ class Instance:  # pylint: disable=too-many-instance-attributes
         Args:
             prompt (str): The name of the prompt (simplified xpath, ODK name)
         """
-        if prompt in self.prompt_cc:
-            self.prompt_cc[prompt] += 1
-        else:
-            self.prompt_cc[prompt] = 1
+        self.prompt_cc[prompt] += 1
 
     def screen_visit(self, enter_event):
         """Track a screen visit for the given event.
@@ -375,10 +456,7 @@ class Instance:  # pylint: disable=too-many-instance-attributes
         Args:
             prompt (str): The name of the prompt (simplified xpath, ODK name)
         """
-        if prompt in self.prompt_visits:
-            self.prompt_visits[prompt] += 1
-        else:
-            self.prompt_visits[prompt] = 1
+        self.prompt_visits[prompt] += 1
         if prompt not in self.prompts:
             self.uncaptured_prompts.add(prompt)
 
@@ -392,9 +470,7 @@ class Instance:  # pylint: disable=too-many-instance-attributes
         if pause.stage == Event.QUESTION and resume.stage == Event.QUESTION:
             time_diff = resume - pause
             if 0 < time_diff < self.short_break_threshold:
-                pause_prompts = set(pause.prompts())
-                resume_prompts = set(resume.prompts())
-                for prompt in pause_prompts & resume_prompts:
+                for prompt in pause.prompt_set & resume.prompt_set:
                     self.update_screen_short_break_time(prompt, time_diff)
 
     def update_screen_short_break_time(self, prompt, time_diff):
@@ -404,10 +480,7 @@ class Instance:  # pylint: disable=too-many-instance-attributes
             prompt (str): The name of the prompt (simplified xpath, ODK name)
             time_diff (int): The amount to add to short break time for prompt.
         """
-        if prompt in self.prompt_short_break:
-            self.prompt_short_break[prompt] += time_diff
-        else:
-            self.prompt_short_break[prompt] = time_diff
+        self.prompt_short_break[prompt] += time_diff
 
     def screen_time(self, enter_event, leave_event):
         """Track resumed screen time.
@@ -418,14 +491,17 @@ class Instance:  # pylint: disable=too-many-instance-attributes
         """
         if enter_event and leave_event and leave_event.stage == Event.QUESTION:
             time_diff = leave_event - enter_event
-            enter_prompts = set(enter_event.prompts())
-            leave_prompts = set(leave_event.prompts())
-            if not enter_prompts & leave_prompts:
-                logging.warning('[%s] Unmatched enter/exit event: %s, %s',
-                                self.folder, str(enter_event),
-                                str(leave_event))
-            for prompt in enter_prompts & leave_prompts:
-                self.update_screen_time(prompt, time_diff)
+            # Walk the smaller side instead of materializing the
+            # intersection as a temporary set
+            enter_prompts = enter_event.prompt_set
+            matched = False
+            for prompt in leave_event.prompt_set:
+                if prompt in enter_prompts:
+                    matched = True
+                    self.update_screen_time(prompt, time_diff)
+            if not matched:
+                LOGGER.warning('[%s] Unmatched enter/exit event: %s, %s',
+                               self.folder, enter_event, leave_event)
 
     def update_screen_time(self, prompt, time_diff):
         """Update the resumed screen time for the given prompt.
@@ -434,10 +510,7 @@ class Instance:  # pylint: disable=too-many-instance-attributes
             prompt (str): The name of the prompt (simplified xpath, ODK name)
             time_diff (int): The amount to add to resumed time for prompt.
         """
-        if prompt in self.prompt_resumed:
-            self.prompt_resumed[prompt] += time_diff
-        else:
-            self.prompt_resumed[prompt] = time_diff
+        self.prompt_resumed[prompt] += time_diff
 
     def update_resumed(self, resumed_diff):
         """Update the overall resumed time for the questionnaire.
@@ -474,6 +547,8 @@ class Instance:  # pylint: disable=too-many-instance-attributes
 class LogParseState:  # pylint: disable=too-few-public-methods
     """A class to track the state during parsing."""
 
+    __slots__ = ('last_resume', 'last_pause', 'last_enter', 'prev_event')
+
     def __init__(self):
         """Initialize parsing state."""
         self.last_resume = None
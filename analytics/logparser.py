@@ -1,5 +1,5 @@
 """The module to define the Logparser and ParserHelper classes."""
-import csv
+import itertools
 import logging
 import os.path
 import re
@@ -7,8 +7,20 @@ import re
 from analytics.event import Event
 
 
+# Pattern for the version stamp, compiled once at import
+_VERSION_RE = re.compile(r'v\d\.\d$')
+
+
 class Logparser:
-    """Class to define methods for parsing log files."""
+    """Class to define methods for parsing log files.
+
+    Class attributes:
+        BUFFER_SIZE (int): Read buffer size for the log file
+        SMALL_LOG (int): Size in bytes under which a log is read whole
+    """
+
+    BUFFER_SIZE = 1 << 18
+    SMALL_LOG = 32 << 20
 
     def __init__(self, path, event_threshold=0, relation_threshold=60_000):
         """Parse a log and save results in this instance.
@@ -31,25 +43,57 @@ class Logparser:
         self.events = []
         try:
             self.events = self.capture_events_from_file()
-        except csv.Error:
+        except UnicodeDecodeError:
             logging.error('[%s] Abandoned due to file parsing error',
                           self.folder)
 
     def capture_events_from_file(self):
         """Parse Events from file and get log version."""
         events = []
-        with open(self.file, newline='', encoding='utf-8') as tsvfile:
-            reader = csv.reader(tsvfile, delimiter='\t')
-            first = next(reader)
-            if first and first[0].startswith('#'):
-                self.version = self.get_version(first[0])
+        with open(self.file, buffering=self.BUFFER_SIZE,
+                  encoding='utf-8') as log:
+            first_line = log.readline()
+            first = first_line.rstrip('\r\n')
+            if first.startswith('#'):
+                self.version = self.get_version(first)
             if self.version is None:
                 logging.warning('[%s] No logging version in first line',
                                 self.folder)
-            tsvfile.seek(0)
-            events = self.capture_events(reader)
+            # Typical logs are far below the cutoff, so the remaining
+            # lines are split in one C-level call; oversized logs fall
+            # back to the buffered line iterator
+            if os.path.getsize(self.file) < self.SMALL_LOG:
+                lines = log.read().splitlines()
+            else:
+                lines = log
+            # Re-feed the already-read first line instead of seeking
+            # back and re-reading it
+            rows = self.split_rows(lines)
+            if first_line:
+                first_row = first.split('\t') if first else []
+                rows = itertools.chain([first_row], rows)
+            events = self.capture_events(rows)
         return events
 
+    @staticmethod
+    def split_rows(lines):
+        """Split raw log lines into rows of tab-separated fields.
+
+        Log fields never contain quoting or embedded delimiters, so a
+        plain split does the work of a csv reader without its dialect
+        machinery. An empty line yields an empty row, as the csv module
+        did.
+
+        Args:
+            lines (iterable of str): The raw lines of the log.
+
+        Yields:
+            The next row (list of str) of the log.
+        """
+        for line in lines:
+            line = line.rstrip('\r\n')
+            yield line.split('\t') if line else []
+
     def capture_events(self, reader):
         """Split the log from file into events and store those events.
 
@@ -59,7 +103,7 @@ class Logparser:
         A ParserHelper object is used to maintain state during parsing.
 
         Args:
-            reader (csv.reader): An iterator with the lines of the log.
+            reader (iterator): An iterator over the rows of the log.
 
         Returns:
             A list of Events.
@@ -67,16 +111,17 @@ class Logparser:
         events = []
         helper = ParserHelper(self.event_threshold, self.relation_threshold,
                               self.folder)
+        # Bind the per-row callables to locals so the loop dispatches
+        # with fast local loads
+        is_valid = self.is_valid_entry
+        parse = helper.parse_next_row
+        folder = self.folder
         for i, row in enumerate(reader):
-            if not self.is_valid_entry(row, i, self.folder):
+            if not is_valid(row, i, folder):
                 continue
             row[0] = int(row[0])
-            result = helper.parse_next_row(row, i)
-            if result:
-                events.extend(result)
-        result = helper.finalize()
-        if result:
-            events.extend(result)
+            parse(row, i, events)
+        helper.finalize(events)
         return events
 
     @staticmethod
@@ -99,15 +144,16 @@ class Logparser:
                 logging.warning('[%s] Line with incorrect length: %d', folder,
                                 ind + 1)
         else:
-            timestamp_pattern = re.compile(r'\d{13}')
-            timestamp = timestamp_pattern.match(row[0]) is not None
-
-            event_pattern = re.compile(r'\w\w')
-            event = event_pattern.match(row[1]) is not None
-
-            xpath = row[2] != ''
-
-            if all((timestamp, event, xpath)):
+            # Plain string checks mirror the old patterns: a timestamp
+            # is 13 leading digits and an event code starts with two
+            # word characters
+            timestamp = row[0]
+            code = row[1]
+            timestamp_ok = len(timestamp) >= 13 and timestamp[:13].isdigit()
+            code_ok = (len(code) >= 2
+                       and (code[0].isalnum() or code[0] == '_')
+                       and (code[1].isalnum() or code[1] == '_'))
+            if row[2] != '' and timestamp_ok and code_ok:
                 valid = True
             elif ind is not None and folder is not None:
                 logging.warning('[%s] Incorrectly formatted line: %d', folder,
@@ -125,7 +171,7 @@ class Logparser:
             The version code found (str), or None if not found.
         """
         version = None
-        match = re.search(r'v\d\.\d$', line)
+        match = _VERSION_RE.search(line)
         if match:
             version = match.group()
         return version
@@ -146,6 +192,10 @@ class Logparser:
 class ParserHelper():
     """Class to store state whilst parsing logs."""
 
+    __slots__ = ('event_threshold', 'relation_threshold', 'folder',
+                 'cur_event', 'last_resume', 'prev_non_relation',
+                 '_thresholds')
+
     def __init__(self, event_threshold, relation_threshold, folder):
         """Initialize state for parsing logs.
 
@@ -160,12 +210,16 @@ class ParserHelper():
         self.event_threshold = event_threshold
         self.relation_threshold = relation_threshold
         self.folder = folder
+        # Maps relation codes to their threshold; every other code falls
+        # back to the event threshold in a single dict probe
+        self._thresholds = dict.fromkeys(Event.relations,
+                                         relation_threshold)
 
         self.cur_event = None
         self.last_resume = None
         self.prev_non_relation = None
 
-    def parse_next_row(self, row, line):
+    def parse_next_row(self, row, line, events):
         """Parse the next row from a log.
 
         Things we check for:
@@ -174,29 +228,36 @@ class ParserHelper():
                 If this happens we insert an oP just before the second oR
             Within one code, the log line times must be increasing
 
+        Completed events are appended directly to the caller's list so
+        that no intermediate list is allocated per event boundary.
+
         Args:
             row (list): The row that has four fields. First entry is the
                 timestamp as an integer.
             line (int): The line number in the log where this entry was found.
+            events (list): The list to append completed Events to.
         """
-        to_return = []
-        if self.cur_event is None:
+        cur_event = self.cur_event
+        if cur_event is None:
             self.cur_event = Event(row, line)
         else:
             this_time = row[0]
             this_code = row[1]
-            time_split = self.is_time_split(this_time)
-            code_change = self.is_code_change(this_code)
+            # The split predicates are inlined here because they run for
+            # every row; is_time_split and is_code_change remain as the
+            # reference implementations
+            threshold = self._thresholds.get(cur_event.code,
+                                             self.event_threshold)
+            time_split = this_time - cur_event.start_time > threshold
+            code_change = cur_event.code != this_code
             if time_split or code_change:
                 self.update_previous(line)
                 self.check_repeatable(time_split, code_change, line)
                 self.check_increasing()
                 pause = self.check_resume(this_code, line)
-                to_extend = self.replace_with_next(row, line, pause)
-                to_return.extend(to_extend)
+                self.replace_with_next(row, line, pause, events)
             else:
-                self.cur_event.add_row(row, line)
-        return to_return
+                cur_event.add_row(row, line)
 
     def update_previous(self, line):
         """Update state to store the event for future parsing.
@@ -278,25 +339,23 @@ class ParserHelper():
             to_return = self.prev_non_relation.create_pause_next()
         return to_return
 
-    def replace_with_next(self, row, line, pause):
+    def replace_with_next(self, row, line, pause, events):
         """Replace current event with the new Event from the next row.
 
+        The completed event, and the inserted onPause if there is one,
+        are appended to the caller's event list.
+
         Args:
             row (list): A row from the log. The time must come as int.
             line (int): The line number in the log where this entry was found.
             pause (analytics.Event): The inserted onPause (if included). Could
                 be None.
-
-        Returns:
-            A list with the current event and if it is not None, the inserted
-            onPause. If there is an articial onPause event to be added, it is
-            included.
+            events (list): The list to append completed Events to.
         """
-        to_return = [self.cur_event]
+        events.append(self.cur_event)
         if pause is not None:
-            to_return.append(pause)
+            events.append(pause)
         self.cur_event = Event(row, line)
-        return to_return
 
     def is_code_change(self, code):
         """Return true iff the input does not match the current code."""
@@ -305,30 +364,28 @@ class ParserHelper():
 
     def is_time_split(self, time):
         """Return true iff the input is a time split based on a threshold."""
-        if self.cur_event.code in Event.relations:
-            threshold = self.relation_threshold
-        else:
-            threshold = self.event_threshold
+        threshold = self._thresholds.get(self.cur_event.code,
+                                         self.event_threshold)
         time_split = time - self.cur_event.start_time > threshold
         return time_split
 
-    def finalize(self):
-        """Return the current event from the end of the log.
+    def finalize(self, events):
+        """Append the current event from the end of the log.
 
         This method is called at the end of parsing the log. Any event that is
-        stored in this ParserHelper instance is returned (with an onPause if
-        necessary) in order to complete parsing.
+        stored in this ParserHelper instance is appended to the caller's
+        list (with an onPause if necessary) in order to complete parsing.
 
-        Returns:
-            A list with the current event and if it is not None, the inserted
-            onPause. If there is an articial onPause event to be added, it is
-            included.
+        Args:
+            events (list): The list to append completed Events to.
         """
+        if self.cur_event is None:
+            # No valid rows were parsed, e.g. an empty log
+            return
         line = self.cur_event.line + len(self.cur_event) + 1
         self.update_previous(line)
         self.check_increasing()
         pause = self.check_resume('oR', line)
-        to_return = [self.cur_event]
+        events.append(self.cur_event)
         if pause is not None:
-            to_return.append(pause)
-        return to_return
+            events.append(pause)